@@ -1,12 +1,20 @@
 from __future__ import annotations
 
+import hashlib
 import io
 import os
+import queue
+import shutil
+import threading
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 import yaml
@@ -14,6 +22,7 @@ from dotenv import load_dotenv
 import requests
 
 from research import aggregate, cache, discovery, extract
+from research.throttle import HostThrottle
 
 load_dotenv()
 
@@ -27,7 +36,15 @@ SEARCH_QUERIES = [
     "{brand} {gender} {category} site:{domain} sale",
 ]
 
+SEARCH_THROTTLE_KEY = "search-api"
 
+WORKER_POLL_SECONDS = 1.0
+
+_LOWER_GENDERS = {gender: gender.lower() for gender, _ in aggregate.CATEGORIES}
+_LOWER_CATEGORIES = {category: category.lower() for _, category in aggregate.CATEGORIES}
+
+
+@st.cache_data(ttl=60, show_spinner=False)
 def load_config() -> dict:
     config = {}
     if Path("config.yml").exists():
@@ -57,17 +74,85 @@ def read_brands(file) -> List[str]:
 
 
 def build_query(brand: str, gender: str, category: str, domain: str) -> List[str]:
-    queries = []
-    for template in SEARCH_QUERIES:
-        queries.append(
-            template.format(
-                brand=brand,
-                gender=gender.lower(),
-                category=category.lower(),
-                domain=domain,
+    gender = _LOWER_GENDERS.get(gender) or gender.lower()
+    category = _LOWER_CATEGORIES.get(category) or category.lower()
+    return [
+        template.format(brand=brand, gender=gender, category=category, domain=domain)
+        for template in SEARCH_QUERIES
+    ]
+
+
+@dataclass
+class _ComboResult:
+    brand: str
+    gender: str
+    category: str
+    competitor: str
+    urls: List[str]
+    discovered: bool = False
+    errors: List[dict] = field(default_factory=list)
+    log_messages: List[str] = field(default_factory=list)
+
+    @property
+    def combo_key(self) -> str:
+        return f"{self.brand}|{self.gender}|{self.category}|{self.competitor}"
+
+
+def _discover_combo(
+    brand: str,
+    gender: str,
+    category: str,
+    competitor: str,
+    domain: str,
+    cached_urls: List[str],
+    max_urls: int,
+    user_agent: str,
+    throttle: HostThrottle,
+) -> _ComboResult:
+    result = _ComboResult(brand, gender, category, competitor, urls=list(cached_urls))
+    urls = result.urls
+    if urls:
+        return result
+    for query in build_query(brand, gender, category, domain):
+        try:
+            new_urls = discovery.cached_urls(query, max_urls)
+            if new_urls is None:
+                with throttle.slot(SEARCH_THROTTLE_KEY):
+                    new_urls = discovery.discover_urls(query, user_agent, max_urls)
+        except requests.RequestException as exc:
+            status_code = getattr(exc.response, "status_code", None)
+            message = (
+                f"Search API request failed ({status_code}) for {query}"
+                if status_code
+                else f"Search API request failed for {query}"
             )
-        )
-    return queries
+            if status_code in {401, 429}:
+                message = (
+                    f"Search API authentication/rate limit error "
+                    f"({status_code}) for {query}"
+                )
+            result.errors.append(
+                {
+                    "timestamp": cache.utc_timestamp(),
+                    "context": result.combo_key,
+                    "error": message,
+                }
+            )
+            result.log_messages.append(message)
+            continue
+        urls.extend(new_urls)
+        del urls[max_urls:]
+    result.discovered = bool(urls)
+    return result
+
+
+def _fetch_error_message(url: str, exc: Exception) -> str:
+    status_code = getattr(getattr(exc, "response", None), "status_code", None)
+    if status_code == 403:
+        return f"Blocked (403) while fetching {url}"
+    if status_code:
+        return f"Fetch failed ({status_code}) for {url}"
+    return f"Fetch failed for {url}"
 
 
 def run_batch(
@@ -79,104 +164,162 @@ def run_batch(
     max_urls = int(config.get("max_urls_per_combo", 6))
     delay_seconds = float(config.get("request_delay_seconds", 2))
     user_agent = str(config.get("user_agent", "LFYDiscountResearcher/1.0"))
+    max_workers = int(config.get("max_workers", 24))
+    throttle = HostThrottle(
+        int(config.get("max_requests_per_host", 8)), delay_seconds
+    )
+    obs_batch: List[dict] = []
+    error_batch: List[dict] = []
+    log_batch: List[str] = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                _discover_combo,
+                brand,
+                gender,
+                category,
+                competitor,
+                domain,
+                discovered_urls.get(f"{brand}|{gender}|{category}|{competitor}", []),
+                max_urls,
+                user_agent,
+                throttle,
+            )
+            for brand in batch_brands
+            for gender, category in aggregate.CATEGORIES
+            for competitor, domain in COMPETITORS.items()
+        ]
+        results = [future.result() for future in futures]
+
+    combos_by_url: Dict[str, List[_ComboResult]] = {}
+    for result in results:
+        if result.discovered:
+            discovered_urls[result.combo_key] = result.urls
+        error_batch.extend(result.errors)
+        log_batch.extend(result.log_messages)
+        for url in result.urls[:max_urls]:
+            combos_by_url.setdefault(url, []).append(result)
+
+    for fetched in extract.fetch_html_many(
+        combos_by_url, user_agent, max_workers=max_workers, throttle=throttle
+    ):
+        url = fetched.url
+        timestamp = cache.utc_timestamp()
+        error = fetched.error
+        if error is None:
+            try:
+                price_info = extract.extract_prices(fetched.html, url)
+            except Exception as exc:  # noqa: BLE001
+                error = exc
+        for combo in combos_by_url[url]:
+            if error is not None:
+                error_batch.append(
+                    {
+                        "timestamp": timestamp,
+                        "context": f"{combo.combo_key}|{url}",
+                        "error": _fetch_error_message(url, error),
+                    }
+                )
+                continue
+            obs_batch.append(
+                {
+                    "brand": combo.brand,
+                    "gender": combo.gender,
+                    "category": combo.category,
+                    "competitor": combo.competitor,
+                    "url": url,
+                    "current_price": price_info.current_price,
+                    "was_price": price_info.was_price,
+                    "discount_pct": extract.compute_discount_pct(
+                        price_info.current_price, price_info.was_price
+                    ),
+                    "timestamp": timestamp,
+                }
+            )
+            log_batch.append(
+                f"Fetched {url} for {combo.brand} {combo.gender} {combo.category}"
+            )
+    cache.append_observations(paths, obs_batch)
+    cache.append_errors(paths, error_batch)
+    cache.write_logs(paths, log_batch)
+    return [row["error"] for row in error_batch]
+
+
+def run_batches(
+    brands: List[str],
+    config: dict,
+    paths: cache.RunPaths,
+    progress_payload: dict,
+    stop_event: threading.Event,
+    progress_queue: "queue.Queue[dict]",
+) -> None:
+    batch_size = int(config.get("batch_size", 10))
+    discovered_urls = cache.load_discovered_urls(paths)
+    completed = list(progress_payload.get("completed_brands", []))
+    for start in range(0, len(brands), batch_size):
+        if stop_event.is_set():
+            break
+        batch = brands[start : start + batch_size]
+        known_combos = set(discovered_urls)
+        batch_errors = run_batch(batch, config, paths, discovered_urls)
+        completed.extend(batch)
+        progress_payload["completed_brands"] = completed
+        progress_payload["status"] = "running"
+        cache.save_discovered_urls(
+            paths,
+            {
+                combo_key: urls
+                for combo_key, urls in discovered_urls.items()
+                if combo_key not in known_combos
+            },
+        )
+        cache.save_progress(paths, progress_payload)
+        progress_queue.put({"batch": batch, "errors": batch_errors})
+
+
+def _drain_progress_queue(progress_queue: "queue.Queue[dict]") -> List[str]:
     errors: List[str] = []
-    for brand in batch_brands:
-        for gender, category in aggregate.CATEGORIES:
-            for competitor, domain in COMPETITORS.items():
-                combo_key = f"{brand}|{gender}|{category}|{competitor}"
-                urls = discovered_urls.get(combo_key, [])
-                if not urls:
-                    for query in build_query(brand, gender, category, domain):
-                        try:
-                            new_urls = discovery.discover_urls(
-                                query, user_agent, max_urls
-                            )
-                        except requests.RequestException as exc:
-                            status_code = getattr(exc.response, "status_code", None)
-                            message = (
-                                f"Search API request failed ({status_code}) for {query}"
-                                if status_code
-                                else f"Search API request failed for {query}"
-                            )
-                            if status_code in {401, 429}:
-                                message = (
-                                    f"Search API authentication/rate limit error "
-                                    f"({status_code}) for {query}"
-                                )
-                            cache.append_error(
-                                paths,
-                                {
-                                    "timestamp": datetime.utcnow().isoformat(),
-                                    "context": combo_key,
-                                    "error": message,
-                                },
-                            )
-                            cache.write_log(paths, message)
-                            errors.append(message)
-                            time.sleep(delay_seconds)
-                            continue
-                        urls.extend(new_urls)
-                        urls = urls[:max_urls]
-                        time.sleep(delay_seconds)
-                    if urls:
-                        discovered_urls[combo_key] = urls
-                if not urls:
-                    continue
-                for url in urls[:max_urls]:
-                    try:
-                        html = extract.fetch_html(url, user_agent)
-                        price_info = extract.extract_prices(html, url)
-                        discount_pct = extract.compute_discount_pct(
-                            price_info.current_price, price_info.was_price
-                        )
-                        cache.append_observation(
-                            paths,
-                            {
-                                "brand": brand,
-                                "gender": gender,
-                                "category": category,
-                                "competitor": competitor,
-                                "url": url,
-                                "current_price": price_info.current_price,
-                                "was_price": price_info.was_price,
-                                "discount_pct": discount_pct,
-                                "timestamp": datetime.utcnow().isoformat(),
-                            },
-                        )
-                        cache.write_log(
-                            paths, f"Fetched {url} for {brand} {gender} {category}"
-                        )
-                    except Exception as exc:  # noqa: BLE001
-                        status_code = getattr(
-                            getattr(exc, "response", None), "status_code", None
-                        )
-                        message = (
-                            f"Fetch failed ({status_code}) for {url}"
-                            if status_code
-                            else f"Fetch failed for {url}"
-                        )
-                        if status_code == 403:
-                            message = f"Blocked (403) while fetching {url}"
-                        cache.append_error(
-                            paths,
-                            {
-                                "timestamp": datetime.utcnow().isoformat(),
-                                "context": f"{brand}|{gender}|{category}|{competitor}|{url}",
-                                "error": message,
-                            },
-                        )
-                        errors.append(message)
-                    time.sleep(delay_seconds)
-    return errors
+    while True:
+        try:
+            update = progress_queue.get_nowait()
+        except queue.Empty:
+            return errors
+        errors.extend(update["errors"])
+
+
+OBSERVATION_DTYPES = {
+    "brand": "category",
+    "gender": "category",
+    "category": "category",
+    "discount_pct": "float32",
+}
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _read_observations(path: str, mtime_ns: int) -> pd.DataFrame:
+    return pd.read_csv(
+        path,
+        usecols=list(OBSERVATION_DTYPES),
+        dtype=OBSERVATION_DTYPES,
+        engine="pyarrow",
+    )
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _read_file_bytes(path: str, mtime_ns: int) -> bytes:
+    return Path(path).read_bytes()
+
+
+def _file_bytes(path: Path) -> bytes:
+    return _read_file_bytes(str(path), path.stat().st_mtime_ns)
 
 
 def load_observations(paths: cache.RunPaths) -> pd.DataFrame:
-    if paths.observations.exists():
-        try:
-            return pd.read_csv(paths.observations)
-        except (pd.errors.ParserError, OSError):
-            return pd.DataFrame()
-    return pd.DataFrame()
+    try:
+        mtime_ns = paths.observations.stat().st_mtime_ns
+        return _read_observations(str(paths.observations), mtime_ns)
+    except (pd.errors.ParserError, ValueError, OSError):
+        return pd.DataFrame()
 
 
 DEFAULT_CATEGORY_POLICY = {
@@ -190,67 +333,68 @@ DEFAULT_CATEGORY_POLICY = {
 }
 
 
-def _build_inferred_defaults(brands: List[str]) -> List[aggregate.PolicyRow]:
-    rows: List[aggregate.PolicyRow] = []
-    for brand in brands:
-        for gender, category in aggregate.CATEGORIES:
-            sale_pct, cap_pct = DEFAULT_CATEGORY_POLICY.get(category, (10, 25))
-            member_extra = 5
-            if sale_pct >= 30:
-                member_extra = min(member_extra, 5)
-            rows.append(
-                aggregate.PolicyRow(
-                    brand=brand,
-                    gender=gender,
-                    category=category,
-                    public_sale_discount_pct=sale_pct,
-                    member_extra_pct=member_extra,
-                    public_discount_cap_pct=cap_pct,
-                    discount_visibility="SALE_ONLY",
-                    msrp_strikethrough_rule="NEVER",
-                    coupon_eligibility="WELCOME+RETARGET",
-                    evidence_level="INFERRED",
-                    confidence="LOW",
-                    why="No observations; inferred defaults",
-                )
-            )
-    return rows
+_INFERRED_CATEGORY_FRAME = pd.DataFrame(
+    aggregate.CATEGORIES, columns=["gender", "category"]
+).assign(
+    public_sale_discount_pct=lambda d: d["category"]
+    .map(lambda c: DEFAULT_CATEGORY_POLICY.get(c, (10, 25))[0])
+    .astype("int16"),
+    public_discount_cap_pct=lambda d: d["category"]
+    .map(lambda c: DEFAULT_CATEGORY_POLICY.get(c, (10, 25))[1])
+    .astype("int16"),
+)
+
+
+def _build_inferred_defaults(brands: List[str]) -> pd.DataFrame:
+    df = pd.DataFrame({"brand": brands}).merge(_INFERRED_CATEGORY_FRAME, how="cross")
+    df = df.assign(
+        member_extra_pct=np.int16(5),
+        discount_visibility="SALE_ONLY",
+        msrp_strikethrough_rule="NEVER",
+        coupon_eligibility="WELCOME+RETARGET",
+        evidence_level="INFERRED",
+        confidence="LOW",
+        why="No observations; inferred defaults",
+    )
+    df = df.reindex(columns=aggregate.POLICY_COLUMNS)
+    return df.astype({column: "category" for column in aggregate.CATEGORICAL_COLUMNS})
 
 
 def _normalize_observations(observations: pd.DataFrame) -> pd.DataFrame:
-    required = ["brand", "gender", "category", "discount_pct"]
+    required = list(OBSERVATION_DTYPES)
     if observations is None or observations.empty:
         return pd.DataFrame(columns=required)
-    missing = [col for col in required if col not in observations.columns]
-    for col in missing:
-        observations[col] = pd.NA
-    return observations[required]
+    return observations.reindex(columns=required).astype(OBSERVATION_DTYPES)
 
 
 def build_policy_output(brands: List[str], observations: pd.DataFrame) -> pd.DataFrame:
     observations = _normalize_observations(observations)
     if observations.empty:
-        rows = _build_inferred_defaults(brands)
+        df = _build_inferred_defaults(brands)
     else:
-        rows = aggregate.aggregate_policy(brands, observations)
-    df = aggregate.policy_rows_to_dataframe(rows)
+        df = aggregate.aggregate_policy_frame(brands, observations)
     return df.reindex(columns=aggregate.POLICY_COLUMNS)
 
 
 def save_excel(df: pd.DataFrame, path: Path) -> None:
-    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+    with pd.ExcelWriter(path, engine="xlsxwriter") as writer:
         df.to_excel(writer, sheet_name="us_discount_policy", index=False)
 
 
+def _frame_digest(df: pd.DataFrame) -> str:
+    hashed = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return hashlib.blake2b(hashed.tobytes(), digest_size=16).hexdigest()
+
+
 def _find_latest_run() -> str | None:
     runs_dir = Path("runs")
     if not runs_dir.exists():
         return None
-    run_ids = sorted([p.name for p in runs_dir.iterdir() if p.is_dir()], reverse=True)
-    for run_id in run_ids:
-        if (runs_dir / run_id / "progress.json").exists():
-            return run_id
-    return None
+    candidates = (
+        p for p in runs_dir.iterdir() if p.is_dir() and (p / "progress.json").exists()
+    )
+    latest = max(candidates, key=lambda p: p.name, default=None)
+    return latest.name if latest else None
 
 
 def _calculate_progress(completed_brands: List[str], total_brands: int) -> float:
@@ -263,9 +407,20 @@ def _calculate_progress(completed_brands: List[str], total_brands: int) -> float
 
 
 def _search_api_status() -> tuple[str, bool]:
-    if os.getenv("SERPAPI_API_KEY"):
+    return _search_api_status_for(
+        os.getenv("SERPAPI_API_KEY"),
+        os.getenv("GOOGLE_CSE_API_KEY"),
+        os.getenv("GOOGLE_CSE_CX"),
+    )
+
+
+@lru_cache(maxsize=1)
+def _search_api_status_for(
+    serpapi_key: str | None, cse_key: str | None, cse_cx: str | None
+) -> tuple[str, bool]:
+    if serpapi_key:
         return "Search API: configured (SerpAPI)", True
-    if os.getenv("GOOGLE_CSE_API_KEY") and os.getenv("GOOGLE_CSE_CX"):
+    if cse_key and cse_cx:
         return "Search API: configured (Google CSE)", True
     return "Search API: not configured \u2192 inference only", False
 
@@ -290,6 +445,11 @@ def main() -> None:
         st.session_state.brands = []
     if "last_errors" not in st.session_state:
         st.session_state.last_errors = []
+    if "executor" not in st.session_state:
+        st.session_state.executor = ThreadPoolExecutor(max_workers=1)
+        st.session_state.progress_queue = queue.Queue()
+        st.session_state.stop_event = threading.Event()
+        st.session_state.worker = None
 
     if not st.session_state.run_id:
         latest_run = _find_latest_run()
@@ -310,7 +470,9 @@ def main() -> None:
         if st.button("Start", disabled=not st.session_state.brands):
             st.session_state.run_status = "running"
             if not st.session_state.run_id:
-                st.session_state.run_id = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+                st.session_state.run_id = datetime.now(timezone.utc).strftime(
+                    "%Y%m%d_%H%M%S"
+                )
     with pause_col:
         if st.button("Pause"):
             st.session_state.run_status = "paused"
@@ -328,6 +490,22 @@ def main() -> None:
     paths = cache.ensure_run_dir(run_id)
     cache.ensure_run_log(paths)
 
+    worker = st.session_state.worker
+    if worker is not None and st.session_state.run_status != "running":
+        st.session_state.stop_event.set()
+        with st.spinner("Stopping after the current batch..."):
+            wait([worker])
+    if worker is not None and worker.done():
+        worker_error = worker.exception()
+        st.session_state.worker = None
+        worker = None
+        if worker_error is not None:
+            st.session_state.run_status = "paused"
+            st.error(f"Batch processing stopped: {worker_error}")
+    st.session_state.last_errors.extend(
+        _drain_progress_queue(st.session_state.progress_queue)
+    )
+
     total_brands = len(st.session_state.brands)
     progress_payload = cache.load_progress(paths) or {
         "run_id": run_id,
@@ -339,13 +517,11 @@ def main() -> None:
     if progress_payload.get("total_brands") != total_brands:
         progress_payload["total_brands"] = total_brands
 
-    discovered_urls = cache.load_discovered_urls(paths)
-
     completed = progress_payload.get("completed_brands", [])
     remaining = [b for b in st.session_state.brands if b not in completed]
 
     progress_value = _calculate_progress(completed, total_brands)
-    progress_bar = st.progress(progress_value)
+    st.progress(progress_value)
     status_placeholder = st.empty()
     show_debug = st.checkbox("Show debug", value=False)
     if show_debug:
@@ -365,25 +541,6 @@ def main() -> None:
         st.warning("Run cancelled.")
         return
 
-    if st.session_state.run_status == "running" and remaining:
-        batch_size = int(config.get("batch_size", 10))
-        batch = remaining[:batch_size]
-        batch_number = (len(completed) // batch_size) + 1
-        status_placeholder.info(
-            f"Processing batch {batch_number} with brands: {', '.join(batch)}"
-        )
-        batch_errors = run_batch(batch, config, paths, discovered_urls)
-        if batch_errors:
-            st.session_state.last_errors.extend(batch_errors)
-        completed.extend(batch)
-        progress_payload["completed_brands"] = completed
-        progress_payload["status"] = "running"
-        cache.save_discovered_urls(paths, discovered_urls)
-        cache.save_progress(paths, progress_payload)
-        progress_value = _calculate_progress(completed, total_brands)
-        progress_bar.progress(progress_value)
-        st.experimental_rerun()
-
     if not remaining:
         progress_payload["status"] = "complete"
         cache.save_progress(paths, progress_payload)
@@ -396,13 +553,37 @@ def main() -> None:
         with st.expander("Recent errors (search/scrape)", expanded=False):
             st.write("\n".join(st.session_state.last_errors[-10:]))
 
+    if st.session_state.run_status == "running" and remaining:
+        if worker is None:
+            st.session_state.stop_event = threading.Event()
+            st.session_state.worker = st.session_state.executor.submit(
+                run_batches,
+                remaining,
+                config,
+                paths,
+                dict(progress_payload),
+                st.session_state.stop_event,
+                st.session_state.progress_queue,
+            )
+        status_placeholder.info(
+            f"Processing {len(remaining)} remaining brands in the background"
+        )
+        time.sleep(WORKER_POLL_SECONDS)
+        st.rerun()
+
     observations = load_observations(paths)
     policy_df = build_policy_output(st.session_state.brands, observations)
-    try:
-        save_excel(policy_df, paths.output_final)
-        save_excel(policy_df, paths.output_partial)
-    except OSError as exc:
-        st.error(f"Failed to write output files: {exc}")
+    policy_key = (run_id, _frame_digest(policy_df))
+    if (
+        st.session_state.get("last_policy_key") != policy_key
+        or not paths.output_final.exists()
+    ):
+        try:
+            save_excel(policy_df, paths.output_final)
+            shutil.copyfile(paths.output_final, paths.output_partial)
+            st.session_state.last_policy_key = policy_key
+        except OSError as exc:
+            st.error(f"Failed to write output files: {exc}")
 
     observed_count = policy_df[policy_df["evidence_level"] == "OBSERVED"].shape[0]
     inferred_count = policy_df[policy_df["evidence_level"] == "INFERRED"].shape[0]
@@ -421,19 +602,19 @@ def main() -> None:
     if paths.output_final.exists():
         st.download_button(
             "Download us_discount_policy.xlsx",
-            data=paths.output_final.read_bytes(),
+            data=_file_bytes(paths.output_final),
             file_name="us_discount_policy.xlsx",
         )
     if paths.observations.exists():
         st.download_button(
             "Download observations.csv",
-            data=paths.observations.read_bytes(),
+            data=_file_bytes(paths.observations),
             file_name="observations.csv",
         )
     if paths.run_log.exists():
         st.download_button(
             "Download run log",
-            data=paths.run_log.read_bytes(),
+            data=_file_bytes(paths.run_log),
             file_name="run.log",
         )
 
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
+import re
 from dataclasses import dataclass
-from statistics import median
-from typing import Dict, Iterable, List
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List
 
 import numpy as np
 import pandas as pd
@@ -39,6 +40,25 @@ POLICY_COLUMNS = [
     "why",
 ]
 
+GROUP_KEYS = ["brand", "gender", "category"]
+
+PCT_COLUMNS = {
+    "public_sale_discount_pct",
+    "member_extra_pct",
+    "public_discount_cap_pct",
+}
+
+CATEGORICAL_COLUMNS = {
+    "brand",
+    "gender",
+    "category",
+    "discount_visibility",
+    "msrp_strikethrough_rule",
+    "coupon_eligibility",
+    "evidence_level",
+    "confidence",
+}
+
 CATEGORY_DEFAULTS = {
     "Clothing": 20,
     "Shoes": 18,
@@ -65,6 +85,15 @@ TIER_B = {"gucci", "prada", "saint laurent", "balenciaga"}
 TIER_C = {"off-white", "versace", "fendi"}
 
 
+_CATEGORY_BASE_SALE = np.array(
+    [CATEGORY_DEFAULTS.get(category, 10) for _, category in CATEGORIES], dtype="int8"
+)
+_CATEGORY_FULL_PRICE_SALE = np.array(
+    [MOSTLY_FULL_PRICE_DEFAULTS.get(category, 6) for _, category in CATEGORIES],
+    dtype="int8",
+)
+
+
 @dataclass
 class PolicyRow:
     brand: str
@@ -81,16 +110,18 @@ class PolicyRow:
     why: str
 
 
+_TIER_PATTERNS = [
+    (tier, re.compile("|".join(re.escape(name) for name in sorted(names))))
+    for tier, names in (("A", TIER_A), ("D", TIER_D), ("B", TIER_B), ("C", TIER_C))
+]
+
+
+@lru_cache(maxsize=4096)
 def infer_tier(brand: str) -> str:
     brand_lower = brand.lower()
-    if any(name in brand_lower for name in TIER_A):
-        return "A"
-    if any(name in brand_lower for name in TIER_D):
-        return "D"
-    if any(name in brand_lower for name in TIER_B):
-        return "B"
-    if any(name in brand_lower for name in TIER_C):
-        return "C"
+    for tier, pattern in _TIER_PATTERNS:
+        if pattern.search(brand_lower):
+            return tier
     return "A"
 
 
@@ -108,82 +139,100 @@ def member_extra_for_tier(tier: str, sale_pct: int) -> int:
     return member_extra
 
 
-def _clamp(value: int, minimum: int, maximum: int) -> int:
-    return max(minimum, min(value, maximum))
+TIERS = ("A", "B", "C", "D")
 
+TIER_SALE_FACTORS = np.array([0.6, 0.8, 0.9, 1.1])
 
-def aggregate_policy(brands: Iterable[str], observations: pd.DataFrame) -> List[PolicyRow]:
-    rows: List[PolicyRow] = []
+_MEMBER_EXTRA_TABLE = np.array(
+    [[member_extra_for_tier(tier, sale_pct) for sale_pct in range(61)] for tier in TIERS],
+    dtype="int16",
+)
+
+
+def _observation_stats(brands: Iterable[str], observations: pd.DataFrame) -> pd.DataFrame:
+    index = pd.MultiIndex.from_tuples(
+        [(brand, gender, category) for brand in brands for gender, category in CATEGORIES],
+        names=GROUP_KEYS,
+    )
+    stats = pd.DataFrame(index=index, columns=["median", "p75", "n"], dtype="float64")
+    positive = observations["discount_pct"] > 0
+    sales = observations.loc[positive, GROUP_KEYS].assign(
+        discount_pct=observations.loc[positive, "discount_pct"].astype(int)
+    )
+    grouped = sales.groupby(GROUP_KEYS, observed=True)["discount_pct"]
+    if grouped.ngroups:
+        quantiles = grouped.quantile([0.5, 0.75]).unstack()
+        stats["median"] = quantiles[0.5]
+        stats["p75"] = quantiles[0.75]
+        stats["n"] = grouped.size()
+    stats["n"] = stats["n"].fillna(0).astype(int)
+    urls_checked = observations.groupby(GROUP_KEYS, observed=True).size()
+    stats["urls_checked"] = urls_checked.reindex(index, fill_value=0).to_numpy()
+    return stats.reset_index()
+
+
+def aggregate_policy_frame(brands: Iterable[str], observations: pd.DataFrame) -> pd.DataFrame:
+    brands = list(brands)
+    if not brands:
+        return _columns_to_dataframe({column: [] for column in POLICY_COLUMNS})
     if observations.empty:
-        observations = pd.DataFrame(
-            columns=[
-                "brand",
-                "gender",
-                "category",
-                "discount_pct",
-            ]
-        )
-    for brand in brands:
-        tier = infer_tier(brand)
-        for gender, category in CATEGORIES:
-            subset = observations[
-                (observations["brand"] == brand)
-                & (observations["gender"] == gender)
-                & (observations["category"] == category)
-            ]
-            discounts = subset["discount_pct"].dropna().tolist()
-            discounts = [int(x) for x in discounts if x > 0]
-            urls_checked = len(subset)
-            if len(discounts) >= 5:
-                evidence = "OBSERVED"
-                sale_pct = _clamp(int(round(median(discounts))), 0, 60)
-                cap_pct = _clamp(int(round(np.percentile(discounts, 75))), 0, 70)
-                cap_pct = max(cap_pct, sale_pct)
-                why = "Observed sale medians"
-                confidence = "HIGH"
-            elif urls_checked >= 10 and len(discounts) < 2:
-                evidence = "OBSERVED"
-                sale_pct = MOSTLY_FULL_PRICE_DEFAULTS.get(category, 6)
-                sale_pct = _clamp(sale_pct, 0, 60)
-                cap_pct = _clamp(sale_pct + 5, 0, 70)
-                why = "Mostly full price"
-                confidence = "MED"
-            else:
-                evidence = "INFERRED"
-                base_sale = CATEGORY_DEFAULTS.get(category, 10)
-                if tier == "A":
-                    sale_pct = max(4, int(base_sale * 0.6))
-                elif tier == "B":
-                    sale_pct = int(base_sale * 0.8)
-                elif tier == "C":
-                    sale_pct = int(base_sale * 0.9)
-                else:
-                    sale_pct = int(base_sale * 1.1)
-                sale_pct = _clamp(sale_pct, 0, 60)
-                cap_pct = _clamp(max(sale_pct + 8, sale_pct), 0, 70)
-                why = "Inferred conservative"
-                confidence = "LOW"
-            member_extra = _clamp(member_extra_for_tier(tier, sale_pct), 0, 15)
-            visibility = "SALE_ONLY"
-            msrp_rule = "ONLY_IF_CREDIBLE" if evidence == "OBSERVED" else "NEVER"
-            coupon = "WELCOME_ONLY" if tier == "A" else "WELCOME+RETARGET"
-            rows.append(
-                PolicyRow(
-                    brand=brand,
-                    gender=gender,
-                    category=category,
-                    public_sale_discount_pct=sale_pct,
-                    member_extra_pct=member_extra,
-                    public_discount_cap_pct=cap_pct,
-                    discount_visibility=visibility,
-                    msrp_strikethrough_rule=msrp_rule,
-                    coupon_eligibility=coupon,
-                    evidence_level=evidence,
-                    confidence=confidence,
-                    why=_trim_why(why),
-                )
-            )
-    return rows
+        observations = pd.DataFrame(columns=GROUP_KEYS + ["discount_pct"])
+    stats = _observation_stats(brands, observations)
+    tier_codes = np.repeat(
+        np.array([TIERS.index(infer_tier(brand)) for brand in brands], dtype="int8"),
+        len(CATEGORIES),
+    )
+    n = stats["n"].to_numpy()
+    urls_checked = stats["urls_checked"].to_numpy()
+    observed = n >= 5
+    mostly_full_price = ~observed & (urls_checked >= 10) & (n < 2)
+
+    observed_sale = np.clip(np.round(stats["median"].fillna(0).to_numpy()), 0, 60)
+    observed_cap = np.maximum(
+        np.clip(np.round(stats["p75"].fillna(0).to_numpy()), 0, 70), observed_sale
+    )
+    full_price_sale = np.clip(np.tile(_CATEGORY_FULL_PRICE_SALE, len(brands)), 0, 60)
+    base_sale = np.tile(_CATEGORY_BASE_SALE, len(brands))
+    inferred_sale = np.trunc(base_sale * TIER_SALE_FACTORS[tier_codes])
+    inferred_sale = np.clip(
+        np.where(tier_codes == 0, np.maximum(inferred_sale, 4), inferred_sale), 0, 60
+    )
+    sale_pct = np.select(
+        [observed, mostly_full_price], [observed_sale, full_price_sale], inferred_sale
+    ).astype("int16")
+    cap_pct = np.select(
+        [observed, mostly_full_price],
+        [observed_cap, np.clip(sale_pct + 5, 0, 70)],
+        np.clip(sale_pct + 8, 0, 70),
+    ).astype("int16")
+
+    has_evidence = observed | mostly_full_price
+    columns = {column: stats[column].to_numpy() for column in GROUP_KEYS}
+    columns.update(
+        public_sale_discount_pct=sale_pct,
+        member_extra_pct=np.clip(_MEMBER_EXTRA_TABLE[tier_codes, sale_pct], 0, 15),
+        public_discount_cap_pct=cap_pct,
+        discount_visibility=np.full(len(stats), "SALE_ONLY", dtype=object),
+        msrp_strikethrough_rule=np.where(has_evidence, "ONLY_IF_CREDIBLE", "NEVER").astype(object),
+        coupon_eligibility=np.where(
+            tier_codes == 0, "WELCOME_ONLY", "WELCOME+RETARGET"
+        ).astype(object),
+        evidence_level=np.where(has_evidence, "OBSERVED", "INFERRED").astype(object),
+        confidence=np.select(
+            [observed, mostly_full_price], ["HIGH", "MED"], "LOW"
+        ).astype(object),
+        why=np.select(
+            [observed, mostly_full_price],
+            [_trim_why("Observed sale medians"), _trim_why("Mostly full price")],
+            _trim_why("Inferred conservative"),
+        ).astype(object),
+    )
+    return _columns_to_dataframe(columns)
+
+
+def aggregate_policy(brands: Iterable[str], observations: pd.DataFrame) -> List[PolicyRow]:
+    df = aggregate_policy_frame(brands, observations)
+    return [PolicyRow(*values) for values in df.itertuples(index=False)]
 
 
 def _trim_why(reason: str) -> str:
@@ -191,10 +240,19 @@ def _trim_why(reason: str) -> str:
     return " ".join(words[:15])
 
 
+def _columns_to_dataframe(columns: Dict[str, Any]) -> pd.DataFrame:
+    data = {}
+    for column in POLICY_COLUMNS:
+        values = columns[column]
+        if column in PCT_COLUMNS:
+            values = np.asarray(values, dtype="int16")
+        elif column in CATEGORICAL_COLUMNS:
+            values = pd.Categorical(values)
+        data[column] = values
+    return pd.DataFrame(data, copy=False)
+
+
 def policy_rows_to_dataframe(rows: List[PolicyRow]) -> pd.DataFrame:
-    data = [row.__dict__ for row in rows]
-    columns = POLICY_COLUMNS
-    if not data:
-        return pd.DataFrame(columns=columns)
-    df = pd.DataFrame(data)
-    return df.reindex(columns=columns)
+    return _columns_to_dataframe(
+        {column: [getattr(row, column) for row in rows] for column in POLICY_COLUMNS}
+    )
@@ -1,13 +1,17 @@
 from __future__ import annotations
 
 import csv
-import json
 import os
+import sqlite3
+from contextlib import closing
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timezone
+from operator import itemgetter
 from pathlib import Path
 from typing import Any, Dict, Iterable, List
 
+import orjson
+
 
 @dataclass
 class RunPaths:
@@ -18,6 +22,10 @@ class RunPaths:
     def discovered_urls(self) -> Path:
         return self.base_dir / "discovered_urls.json"
 
+    @property
+    def cache_db(self) -> Path:
+        return self.base_dir / "cache.db"
+
     @property
     def observations(self) -> Path:
         return self.base_dir / "observations.csv"
@@ -49,54 +57,101 @@ def ensure_run_dir(run_id: str, root: str = "runs") -> RunPaths:
     return RunPaths(run_id=run_id, base_dir=base)
 
 
+def utc_timestamp() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp = path.with_suffix(".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
 def load_progress(paths: RunPaths) -> Dict[str, Any] | None:
     if not paths.progress.exists():
         return None
-    return json.loads(paths.progress.read_text())
+    return orjson.loads(paths.progress.read_bytes())
 
 
 def save_progress(paths: RunPaths, payload: Dict[str, Any]) -> None:
-    payload["updated_at"] = datetime.utcnow().isoformat()
-    paths.progress.write_text(json.dumps(payload, indent=2))
+    payload["updated_at"] = utc_timestamp()
+    _write_atomic(paths.progress, orjson.dumps(payload, option=orjson.OPT_INDENT_2))
 
 
-def load_discovered_urls(paths: RunPaths) -> Dict[str, List[str]]:
-    if not paths.discovered_urls.exists():
-        return {}
-    return json.loads(paths.discovered_urls.read_text())
+def _connect_cache_db(paths: RunPaths) -> sqlite3.Connection:
+    conn = sqlite3.connect(paths.cache_db)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS discovered ("
+        "combo_key TEXT PRIMARY KEY, urls TEXT NOT NULL)"
+    )
+    return conn
 
 
-def save_discovered_urls(paths: RunPaths, data: Dict[str, List[str]]) -> None:
-    paths.discovered_urls.write_text(json.dumps(data, indent=2))
+def load_discovered_urls(paths: RunPaths) -> Dict[str, List[str]]:
+    if not paths.cache_db.exists():
+        if not paths.discovered_urls.exists():
+            return {}
+        legacy = orjson.loads(paths.discovered_urls.read_bytes())
+        save_discovered_urls(paths, legacy)
+        return legacy
+    with closing(_connect_cache_db(paths)) as conn:
+        rows = conn.execute("SELECT combo_key, urls FROM discovered").fetchall()
+    return {combo_key: orjson.loads(urls) for combo_key, urls in rows}
 
 
-def _append_csv_row(path: Path, header: Iterable[str], row: Dict[str, Any]) -> None:
+def save_discovered_urls(paths: RunPaths, data: Dict[str, List[str]]) -> None:
+    with closing(_connect_cache_db(paths)) as conn, conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO discovered (combo_key, urls) VALUES (?, ?)",
+            ((combo_key, orjson.dumps(urls).decode()) for combo_key, urls in data.items()),
+        )
+
+
+OBSERVATION_COLUMNS = [
+    "brand",
+    "gender",
+    "category",
+    "competitor",
+    "url",
+    "current_price",
+    "was_price",
+    "discount_pct",
+    "timestamp",
+]
+
+ERROR_COLUMNS = ["timestamp", "context", "error"]
+
+
+def _append_csv_rows(
+    path: Path, header: List[str], rows: Iterable[Dict[str, Any]]
+) -> None:
     file_exists = path.exists()
+    to_tuple = itemgetter(*header)
     with path.open("a", newline="") as handle:
-        writer = csv.DictWriter(handle, fieldnames=list(header))
+        writer = csv.writer(handle)
         if not file_exists:
-            writer.writeheader()
-        writer.writerow(row)
+            writer.writerow(header)
+        writer.writerows(map(to_tuple, rows))
 
 
 def append_observation(paths: RunPaths, row: Dict[str, Any]) -> None:
-    header = [
-        "brand",
-        "gender",
-        "category",
-        "competitor",
-        "url",
-        "current_price",
-        "was_price",
-        "discount_pct",
-        "timestamp",
-    ]
-    _append_csv_row(paths.observations, header, row)
+    append_observations(paths, [row])
+
+
+def append_observations(paths: RunPaths, rows: List[Dict[str, Any]]) -> None:
+    if rows:
+        _append_csv_rows(paths.observations, OBSERVATION_COLUMNS, rows)
 
 
 def append_error(paths: RunPaths, row: Dict[str, Any]) -> None:
-    header = ["timestamp", "context", "error"]
-    _append_csv_row(paths.errors, header, row)
+    append_errors(paths, [row])
+
+
+def append_errors(paths: RunPaths, rows: List[Dict[str, Any]]) -> None:
+    if rows:
+        _append_csv_rows(paths.errors, ERROR_COLUMNS, rows)
 
 
 def ensure_run_log(paths: RunPaths) -> None:
@@ -105,7 +160,13 @@ def ensure_run_log(paths: RunPaths) -> None:
 
 
 def write_log(paths: RunPaths, message: str) -> None:
+    write_logs(paths, [message])
+
+
+def write_logs(paths: RunPaths, messages: List[str]) -> None:
+    if not messages:
+        return
     ensure_run_log(paths)
-    timestamp = datetime.utcnow().isoformat()
+    timestamp = utc_timestamp()
     with paths.run_log.open("a") as handle:
-        handle.write(f"[{timestamp}] {message}\n")
+        handle.writelines(f"[{timestamp}] {message}\n" for message in messages)
@@ -1,13 +1,21 @@
 from __future__ import annotations
 
 import os
-from typing import List
+from typing import List, Optional
 
-import requests
+import orjson
+
+from research import response_cache
+from research.http import DEFAULT_TIMEOUT, build_session
 
 SERPAPI_URL = "https://serpapi.com/search.json"
 GOOGLE_CSE_URL = "https://www.googleapis.com/customsearch/v1"
 
+CACHE_NAMESPACE = "search"
+CACHE_TTL_SECONDS = 7 * 24 * 3600
+
+_SESSION = build_session(pool_connections=2, pool_maxsize=16)
+
 
 def _get_serpapi_key() -> str | None:
     return os.getenv("SERPAPI_API_KEY")
@@ -21,11 +29,12 @@ def discover_with_serpapi(query: str, user_agent: str, max_results: int) -> List
     api_key = _get_serpapi_key()
     if not api_key:
         return []
-    resp = requests.get(
+    resp = _SESSION.get(
         SERPAPI_URL,
         params={"engine": "google", "api_key": api_key, "q": query},
         headers={"User-Agent": user_agent},
-        timeout=30,
+        timeout=DEFAULT_TIMEOUT,
+        stream=False,
     )
     resp.raise_for_status()
     data = resp.json()
@@ -43,11 +52,12 @@ def discover_with_google_cse(query: str, user_agent: str, max_results: int) -> L
     api_key, cx = _get_google_keys()
     if not api_key or not cx:
         return []
-    resp = requests.get(
+    resp = _SESSION.get(
         GOOGLE_CSE_URL,
         params={"key": api_key, "cx": cx, "q": query, "num": min(10, max_results)},
         headers={"User-Agent": user_agent},
-        timeout=30,
+        timeout=DEFAULT_TIMEOUT,
+        stream=False,
     )
     resp.raise_for_status()
     data = resp.json()
@@ -61,18 +71,22 @@ def discover_with_google_cse(query: str, user_agent: str, max_results: int) -> L
     return urls
 
 
+def _cache_key(query: str, max_results: int) -> str:
+    return f"{max_results}|{' '.join(query.lower().split())}"
+
+
+def cached_urls(query: str, max_results: int) -> Optional[List[str]]:
+    cached = response_cache.get(CACHE_NAMESPACE, _cache_key(query, max_results), CACHE_TTL_SECONDS)
+    return orjson.loads(cached) if cached is not None else None
+
+
 def discover_urls(query: str, user_agent: str, max_results: int) -> List[str]:
-    urls = []
-    urls.extend(discover_with_serpapi(query, user_agent, max_results))
-    if len(urls) < max_results:
+    urls = discover_with_serpapi(query, user_agent, max_results)
+    if len(urls) < max_results and all(_get_google_keys()):
         urls.extend(discover_with_google_cse(query, user_agent, max_results - len(urls)))
-    deduped = []
-    seen = set()
-    for url in urls:
-        if url in seen:
-            continue
-        seen.add(url)
-        deduped.append(url)
-        if len(deduped) >= max_results:
-            break
-    return deduped
+    urls = list(dict.fromkeys(urls))[:max_results]
+    if urls:
+        response_cache.put(
+            CACHE_NAMESPACE, _cache_key(query, max_results), orjson.dumps(urls), CACHE_TTL_SECONDS
+        )
+    return urls
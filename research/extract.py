@@ -1,16 +1,68 @@
 from __future__ import annotations
 
-import json
+import hashlib
 import re
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
-from typing import Any, Iterable, Optional, Tuple
+from itertools import chain, islice, zip_longest
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
 
+import charset_normalizer
 import extruct
-import requests
-from bs4 import BeautifulSoup
+import lxml.html
+import orjson
+from lxml import etree
 from w3lib.html import get_base_url
 
-PRICE_REGEX = re.compile(r"\b(\d{2,5}(?:\.\d{2})?)\b")
+from research import response_cache
+from research.http import DEFAULT_TIMEOUT, build_session
+from research.throttle import HostThrottle
+
+PRICE_REGEX = re.compile(r"\b(\d{2,5}(?:\.\d{2}(?!\d))?)\b", re.ASCII)
+
+_PRICE_CLASSES = ("price", "current-price", "product-price", "sales", "sale-price")
+_PRICE_XPATH = etree.XPath(
+    "//span[%s]"
+    % " or ".join(
+        f"contains(concat(' ', normalize-space(@class), ' '), ' {cls} ')"
+        for cls in _PRICE_CLASSES
+    )
+)
+_SPAN_XPATH = etree.XPath("(//span)[position() <= 5]")
+_NODE_TEXT_XPATH = etree.XPath(".//text()[not(ancestor::script or ancestor::style)]")
+_HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+
+_PRICE_KEY = re.compile(r'"price"\s*:')
+_JSON_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[{}]')
+_STRUCTURAL_CHAR = re.compile(r'[{}"]')
+EMBEDDED_JSON_MAX_CHARS = 64 * 1024
+_BACKWARD_SCAN_CHUNK = 4096
+EMBEDDED_JSON_SCAN_FACTOR = 4
+
+PRICE_CACHE_SIZE = 1024
+
+_PRICE_CACHE: "OrderedDict[bytes, PriceInfo]" = OrderedDict()
+_PRICE_CACHE_LOCK = threading.Lock()
+
+FETCH_CHUNK_SIZE = 64 * 1024
+ENCODING_SNIFF_BYTES = 4096
+
+_HEADER_CHARSET = re.compile(r"charset=[\"']?([\w.:-]+)", re.IGNORECASE)
+_META_CHARSET = re.compile(rb"<meta[^>]+charset=[\"']?([\w.:-]+)", re.IGNORECASE)
+
+BASE_TAG_SCAN_CHARS = 8192
+
+CACHE_NAMESPACE = "html"
+CACHE_TTL_SECONDS = 24 * 3600
+
+_SESSION = build_session(
+    pool_connections=32, pool_maxsize=64, retries=2, backoff_factor=0.2
+)
+_SESSION.headers["User-Agent"] = "LFYDiscountResearcher/1.0"
 
 
 @dataclass
@@ -19,81 +71,305 @@ class PriceInfo:
     was_price: Optional[float]
 
 
+def cached_html(url: str) -> Optional[str]:
+    cached = response_cache.get(CACHE_NAMESPACE, url, CACHE_TTL_SECONDS)
+    return zlib.decompress(cached).decode() if cached is not None else None
+
+
 def fetch_html(url: str, user_agent: str) -> str:
-    resp = requests.get(url, headers={"User-Agent": user_agent}, timeout=30)
-    resp.raise_for_status()
-    return resp.text
+    with _SESSION.get(
+        url,
+        headers={"User-Agent": user_agent},
+        timeout=DEFAULT_TIMEOUT,
+        stream=True,
+    ) as resp:
+        resp.raise_for_status()
+        body = b"".join(resp.iter_content(chunk_size=FETCH_CHUNK_SIZE))
+        html = _decode_body(body, resp.headers.get("Content-Type", ""))
+    response_cache.put(
+        CACHE_NAMESPACE, url, zlib.compress(html.encode(), 1), CACHE_TTL_SECONDS
+    )
+    return html
 
 
-def _extract_from_jsonld(html: str, url: str) -> PriceInfo:
-    data = extruct.extract(html, base_url=get_base_url(html, url), syntaxes=["json-ld"])
-    offers = []
-    for entry in data.get("json-ld", []):
-        if isinstance(entry, dict):
-            offers.append(entry)
-    for entry in offers:
-        if entry.get("@type") == "Product" and "offers" in entry:
-            offers_data = entry.get("offers")
-            if isinstance(offers_data, dict):
-                offers_data = [offers_data]
-            if isinstance(offers_data, list):
-                for offer in offers_data:
-                    price = _safe_float(offer.get("price"))
-                    was_price = _safe_float(offer.get("priceSpecification", {}).get("price"))
-                    if price:
-                        return PriceInfo(price, was_price)
-        if entry.get("@type") == "Offer":
-            price = _safe_float(entry.get("price"))
-            was_price = _safe_float(entry.get("priceSpecification", {}).get("price"))
-            if price:
-                return PriceInfo(price, was_price)
-    return PriceInfo(None, None)
+@dataclass
+class FetchResult:
+    url: str
+    html: Optional[str]
+    error: Optional[Exception] = None
 
 
-def _extract_from_embedded_json(html: str) -> PriceInfo:
-    for match in re.findall(r"\{[^\{\}]*\"price\"[^\{\}]*\}", html):
+def _interleave_hosts(urls: Iterable[str]) -> List[str]:
+    by_host: Dict[str, List[str]] = {}
+    for url in urls:
+        by_host.setdefault(urlsplit(url).netloc.lower(), []).append(url)
+    return [url for group in zip_longest(*by_host.values()) for url in group if url]
+
+
+def _fetch_one(url: str, user_agent: str, throttle: HostThrottle) -> FetchResult:
+    try:
+        html = cached_html(url)
+        if html is None:
+            with throttle.slot(url):
+                html = fetch_html(url, user_agent)
+        return FetchResult(url, html)
+    except Exception as exc:  # noqa: BLE001
+        return FetchResult(url, None, exc)
+
+
+def fetch_html_many(
+    urls: Iterable[str],
+    user_agent: str,
+    max_workers: int = 20,
+    throttle: Optional[HostThrottle] = None,
+) -> Iterator[FetchResult]:
+    throttle = throttle or HostThrottle(max_per_host=1, delay_seconds=0.1)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(_fetch_one, url, user_agent, throttle)
+            for url in _interleave_hosts(urls)
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def _decode_body(body: bytes, content_type: str) -> str:
+    match = _HEADER_CHARSET.search(content_type) or _META_CHARSET.search(
+        body[:ENCODING_SNIFF_BYTES]
+    )
+    encoding = None
+    if match:
+        encoding = match.group(1)
+        encoding = encoding.decode("ascii") if isinstance(encoding, bytes) else encoding
+    if encoding is None:
         try:
-            payload = json.loads(match)
-        except json.JSONDecodeError:
+            return body.decode("utf-8")
+        except UnicodeDecodeError as exc:
+            sample = body[exc.start : exc.start + ENCODING_SNIFF_BYTES]
+        best = charset_normalizer.from_bytes(sample).best()
+        encoding = best.encoding if best and best.encoding != "ascii" else "utf-8"
+    try:
+        return body.decode(encoding, errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+
+def close_session() -> None:
+    _SESSION.close()
+
+
+def _has_jsonld(html: str) -> bool:
+    return html.find("application/ld+json") >= 0
+
+
+_PricePair = Tuple[Optional[float], Optional[float]]
+
+
+def _offer_prices(offer: Dict[str, Any]) -> Iterator[_PricePair]:
+    specification = offer.get("priceSpecification")
+    was_price = specification.get("price") if isinstance(specification, dict) else None
+    yield _safe_float(offer.get("price")), _safe_float(was_price)
+
+
+def _product_prices(product: Dict[str, Any]) -> Iterator[_PricePair]:
+    offers = product.get("offers")
+    if isinstance(offers, dict):
+        offers = [offers]
+    if not isinstance(offers, list):
+        return
+    for offer in offers:
+        if isinstance(offer, dict):
+            yield from _offer_prices(offer)
+
+
+_JSONLD_HANDLERS: Dict[str, Callable[[Dict[str, Any]], Iterator[_PricePair]]] = {
+    "Product": _product_prices,
+    "Offer": _offer_prices,
+}
+
+
+def _jsonld_prices(
+    html: str, url: str, tree: Optional[etree._Element] = None
+) -> Iterator[PriceInfo]:
+    if not _has_jsonld(html):
+        return
+    if tree is None:
+        tree = _parse_html(html)
+        if tree is None:
+            return
+    base_url = url if "<base" not in html[:BASE_TAG_SCAN_CHARS] else get_base_url(html, url)
+    data = extruct.extract(tree, base_url=base_url, syntaxes=["json-ld"])
+    for entry in data.get("json-ld", []):
+        if not isinstance(entry, dict):
+            continue
+        entry_type = entry.get("@type")
+        handler = _JSONLD_HANDLERS.get(entry_type) if isinstance(entry_type, str) else None
+        if handler is None:
             continue
-        price = _safe_float(payload.get("price"))
-        was_price = _safe_float(payload.get("compare_at_price") or payload.get("was_price"))
-        if price:
-            return PriceInfo(price, was_price)
-    return PriceInfo(None, None)
-
-
-def _extract_from_dom(html: str) -> PriceInfo:
-    soup = BeautifulSoup(html, "html.parser")
-    price_texts: Iterable[str] = []
-    selectors = [
-        "span.price",
-        "span.current-price",
-        "span.product-price",
-        "span.sales",
-        "span.sale-price",
-    ]
-    for sel in selectors:
-        node = soup.select_one(sel)
-        if node and node.get_text(strip=True):
-            price_texts = [node.get_text(strip=True)]
-            break
-    if not price_texts:
-        price_texts = [text.get_text(strip=True) for text in soup.select("span")[:5]]
-    prices = _extract_numbers(" ".join(price_texts))
+        for price, was_price in handler(entry):
+            yield PriceInfo(price, was_price)
+
+
+def _extract_from_jsonld(
+    html: str, url: str, tree: Optional[etree._Element] = None
+) -> PriceInfo:
+    return _first_price(_jsonld_prices(html, url, tree))
+
+
+def _price_from_json(text: str) -> PriceInfo:
+    try:
+        payload = orjson.loads(text)
+    except orjson.JSONDecodeError:
+        return PriceInfo(None, None)
+    if not isinstance(payload, dict):
+        return PriceInfo(None, None)
+    price = _safe_float(payload.get("price"))
+    was_price = _safe_float(payload.get("compare_at_price") or payload.get("was_price"))
+    return PriceInfo(price, was_price)
+
+
+def _is_escaped(html: str, index: int) -> bool:
+    backslashes = 0
+    while index > backslashes and html[index - backslashes - 1] == "\\":
+        backslashes += 1
+    return backslashes % 2 == 1
+
+
+def _scan_back(
+    html: str, upper: int, lower: int, depth: int, in_string: bool
+) -> Tuple[int, int, bool]:
+    while upper > lower:
+        chunk_start = max(lower, upper - _BACKWARD_SCAN_CHUNK)
+        for match in _STRUCTURAL_CHAR.finditer(html[chunk_start:upper][::-1]):
+            index = upper - 1 - match.start()
+            char = match.group()
+            if char == '"':
+                if not (in_string and _is_escaped(html, index)):
+                    in_string = not in_string
+            elif in_string:
+                continue
+            elif char == "}":
+                depth += 1
+            elif depth:
+                depth -= 1
+            else:
+                return index, depth, in_string
+        upper = chunk_start
+    return -1, depth, in_string
+
+
+def _object_end(html: str, start: int, upper: int) -> int:
+    depth = 0
+    for token in _JSON_TOKEN.finditer(html, start, upper):
+        char = html[token.start()]
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return token.end()
+    return -1
+
+
+def _embedded_json_prices(html: str) -> Iterator[PriceInfo]:
+    budget = EMBEDDED_JSON_SCAN_FACTOR * len(html) + EMBEDDED_JSON_MAX_CHARS
+    seen = set()
+    previous_key, previous_start = -1, -1
+    for key in _PRICE_KEY.finditer(html):
+        key_start = key.start()
+        lower = max(0, key_start - EMBEDDED_JSON_MAX_CHARS)
+        floor = max(lower, previous_key)
+        start, depth, in_string = _scan_back(html, key_start, floor, 0, False)
+        if start < 0 and floor > lower:
+            if depth == 0 and not in_string:
+                # Back at the previous key in the same state: its scan applies.
+                start = previous_start
+            else:
+                start, _, _ = _scan_back(html, floor, lower, depth, in_string)
+                budget -= floor - lower
+        budget -= key_start - floor
+        previous_key, previous_start = key_start, start
+        if budget < 0:
+            return
+        if start < 0 or start in seen:
+            continue
+        seen.add(start)
+        upper = min(len(html), start + EMBEDDED_JSON_MAX_CHARS)
+        end = _object_end(html, start, upper)
+        budget -= (end if end > 0 else upper) - start
+        if end > 0:
+            yield _price_from_json(html[start:end])
+
+
+def _extract_from_embedded_json(html: str) -> PriceInfo:
+    return _first_price(_embedded_json_prices(html))
+
+
+def _parse_html(html: str) -> Optional[etree._Element]:
+    try:
+        return lxml.html.document_fromstring(html.encode("utf-8"), parser=_HTML_PARSER)
+    except etree.ParserError:
+        return None
+
+
+def _node_text(node: etree._Element) -> str:
+    return "".join(text.strip() for text in _NODE_TEXT_XPATH(node))
+
+
+def _dom_prices(html: str, tree: Optional[etree._Element] = None) -> Iterator[PriceInfo]:
+    if tree is None:
+        tree = _parse_html(html)
+    if tree is None:
+        return
+    price_text = next(filter(None, map(_node_text, _PRICE_XPATH(tree))), None)
+    if price_text is not None:
+        price_texts: Iterable[str] = (price_text,)
+    else:
+        price_texts = map(_node_text, _SPAN_XPATH(tree))
+    prices = _extract_numbers(price_texts, 2)
     if prices:
-        return PriceInfo(prices[0], prices[1] if len(prices) > 1 else None)
-    return PriceInfo(None, None)
+        yield PriceInfo(prices[0], prices[1] if len(prices) > 1 else None)
+
+
+def _extract_from_dom(html: str, tree: Optional[etree._Element] = None) -> PriceInfo:
+    return _first_price(_dom_prices(html, tree))
+
+
+def _first_price(candidates: Iterable[PriceInfo]) -> PriceInfo:
+    return next(
+        (info for info in candidates if info.current_price), PriceInfo(None, None)
+    )
 
 
 def extract_prices(html: str, url: str) -> PriceInfo:
-    price_info = _extract_from_jsonld(html, url)
-    if price_info.current_price:
-        return price_info
-    price_info = _extract_from_embedded_json(html)
-    if price_info.current_price:
-        return price_info
-    return _extract_from_dom(html)
+    key = hashlib.blake2b(html.encode(), digest_size=16).digest()
+    with _PRICE_CACHE_LOCK:
+        cached = _PRICE_CACHE.get(key)
+        if cached is not None:
+            _PRICE_CACHE.move_to_end(key)
+            return cached
+    price_info = _extract_prices(html, url)
+    with _PRICE_CACHE_LOCK:
+        _PRICE_CACHE[key] = price_info
+        if len(_PRICE_CACHE) > PRICE_CACHE_SIZE:
+            _PRICE_CACHE.popitem(last=False)
+    return price_info
+
+
+def clear_price_cache() -> None:
+    with _PRICE_CACHE_LOCK:
+        _PRICE_CACHE.clear()
+
+
+def _extract_prices(html: str, url: str) -> PriceInfo:
+    tree = _parse_html(html) if _has_jsonld(html) else None
+    return _first_price(
+        chain(
+            _jsonld_prices(html, url, tree),
+            _embedded_json_prices(html),
+            _dom_prices(html, tree),
+        )
+    )
 
 
 def compute_discount_pct(current_price: Optional[float], was_price: Optional[float]) -> Optional[int]:
@@ -103,14 +379,9 @@ def compute_discount_pct(current_price: Optional[float], was_price: Optional[flo
     return max(0, discount)
 
 
-def _extract_numbers(text: str) -> list[float]:
-    numbers = []
-    for match in PRICE_REGEX.findall(text):
-        try:
-            numbers.append(float(match))
-        except ValueError:
-            continue
-    return numbers
+def _extract_numbers(texts: Iterable[str], limit: int) -> list[float]:
+    matches = chain.from_iterable(map(PRICE_REGEX.finditer, texts))
+    return [float(match.group(1)) for match in islice(matches, limit)]
 
 
 def _safe_float(value: Any) -> Optional[float]:
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+CACHE_PATH = Path("runs") / ".response_cache.db"
+PURGE_INTERVAL_SECONDS = 60 * 60
+
+_local = threading.local()
+_purge_lock = threading.Lock()
+_last_purge: Dict[Tuple[Path, str], float] = {}
+
+
+def _connect(path: Path) -> sqlite3.Connection:
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, "
+            "stored_at REAL NOT NULL, PRIMARY KEY (namespace, key))"
+        )
+        connections[path] = conn
+    return conn
+
+
+def _purge_due(path: Path, namespace: str, now: float) -> bool:
+    with _purge_lock:
+        if now - _last_purge.get((path, namespace), float("-inf")) < PURGE_INTERVAL_SECONDS:
+            return False
+        _last_purge[(path, namespace)] = now
+        return True
+
+
+def get(
+    namespace: str, key: str, ttl_seconds: float, path: Optional[Path] = None
+) -> bytes | None:
+    row = _connect(path or CACHE_PATH).execute(
+        "SELECT value FROM responses WHERE namespace = ? AND key = ? AND stored_at >= ?",
+        (namespace, key, time.time() - ttl_seconds),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def put(
+    namespace: str,
+    key: str,
+    value: bytes,
+    ttl_seconds: float,
+    path: Optional[Path] = None,
+) -> None:
+    path = path or CACHE_PATH
+    conn = _connect(path)
+    now = time.time()
+    with conn:
+        if _purge_due(path, namespace, now):
+            conn.execute(
+                "DELETE FROM responses WHERE namespace = ? AND stored_at < ?",
+                (namespace, now - ttl_seconds),
+            )
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (namespace, key, value, stored_at) "
+            "VALUES (?, ?, ?, ?)",
+            (namespace, key, value, now),
+        )
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+from urllib.parse import urlsplit
+
+
+class HostThrottle:
+    """Caps concurrent requests per host and paces each slot by ``delay_seconds``."""
+
+    def __init__(self, max_per_host: int, delay_seconds: float) -> None:
+        self.max_per_host = max(1, max_per_host)
+        self.delay_seconds = max(0.0, delay_seconds)
+        self._lock = threading.Lock()
+        self._slots: Dict[str, threading.BoundedSemaphore] = {}
+
+    def _semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            slot = self._slots.get(host)
+            if slot is None:
+                slot = threading.BoundedSemaphore(self.max_per_host)
+                self._slots[host] = slot
+            return slot
+
+    @contextmanager
+    def slot(self, target: str) -> Iterator[None]:
+        host = urlsplit(target).netloc.lower() if "://" in target else target
+        with self._semaphore(host):
+            try:
+                yield
+            finally:
+                time.sleep(self.delay_seconds)
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import datetime, timezone
 
 import pandas as pd
 from dotenv import load_dotenv
@@ -11,7 +11,7 @@ from research import cache
 
 def main() -> None:
     load_dotenv()
-    run_id = f"selfcheck_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
+    run_id = f"selfcheck_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}"
     paths = cache.ensure_run_dir(run_id)
     brands = ["SampleBrandA", "SampleBrandB"]
     observations = pd.DataFrame()
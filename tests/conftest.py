@@ -3,6 +3,26 @@ from __future__ import annotations
 import sys
 from pathlib import Path
 
+import pytest
+
 ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
+
+
+@pytest.fixture(autouse=True)
+def _isolated_response_cache(tmp_path, monkeypatch):
+    from research import response_cache
+
+    monkeypatch.setattr(response_cache, "CACHE_PATH", tmp_path / "response_cache.db")
+
+
+@pytest.fixture
+def no_slot_throttle():
+    from research.throttle import HostThrottle
+
+    class NoSlotThrottle(HostThrottle):
+        def slot(self, target):
+            raise AssertionError(f"unexpected throttle slot for {target}")
+
+    return NoSlotThrottle(1, 5)
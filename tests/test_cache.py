@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import json
+
+from research import cache, response_cache
+
+
+def test_discovered_urls_round_trip(tmp_path):
+    paths = cache.ensure_run_dir("run", root=str(tmp_path))
+    assert cache.load_discovered_urls(paths) == {}
+
+    cache.save_discovered_urls(paths, {"A|Men|Shoes|Farfetch": ["https://a", "https://b"]})
+    cache.save_discovered_urls(paths, {"B|Women|Bags|MyTheresa": ["https://c"]})
+
+    assert cache.load_discovered_urls(paths) == {
+        "A|Men|Shoes|Farfetch": ["https://a", "https://b"],
+        "B|Women|Bags|MyTheresa": ["https://c"],
+    }
+
+
+def test_discovered_urls_imports_legacy_json(tmp_path):
+    paths = cache.ensure_run_dir("run", root=str(tmp_path))
+    legacy = {"A|Men|Shoes|Farfetch": ["https://a"]}
+    paths.discovered_urls.write_text(json.dumps(legacy))
+
+    assert cache.load_discovered_urls(paths) == legacy
+    assert paths.cache_db.exists()
+    assert cache.load_discovered_urls(paths) == legacy
+
+
+def test_response_cache_respects_ttl(tmp_path):
+    path = tmp_path / "responses.db"
+    assert response_cache.get("search", "q", 60, path=path) is None
+
+    response_cache.put("search", "q", b'["https://a"]', 60, path=path)
+
+    assert response_cache.get("search", "q", 60, path=path) == b'["https://a"]'
+    assert response_cache.get("html", "q", 60, path=path) is None
+    assert response_cache.get("search", "q", -1, path=path) is None
+
+
+def test_response_cache_purges_expired_rows_on_put(tmp_path, monkeypatch):
+    path = tmp_path / "responses.db"
+    now = 1_000_000.0
+    monkeypatch.setattr(response_cache.time, "time", lambda: now)
+    response_cache.put("html", "old", b"a", 60, path=path)
+    response_cache.put("search", "other", b"b", 60, path=path)
+
+    now += response_cache.PURGE_INTERVAL_SECONDS + 1
+    response_cache.put("html", "new", b"c", 60, path=path)
+
+    keys = response_cache._connect(path).execute(
+        "SELECT namespace, key FROM responses ORDER BY namespace, key"
+    ).fetchall()
+    assert keys == [("html", "new"), ("search", "other")]
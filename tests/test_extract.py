@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import time
+
+from research import extract
+from research.throttle import HostThrottle
+
+
+def test_fetch_html_many_returns_pages_and_errors(monkeypatch):
+    def fake_fetch(url, user_agent):
+        if url.endswith("/missing"):
+            raise ValueError("not found")
+        return f"<html>{url}</html>"
+
+    monkeypatch.setattr(extract, "fetch_html", fake_fetch)
+    urls = ["https://a.com/1", "https://a.com/missing", "https://b.com/1"]
+
+    results = {
+        result.url: result
+        for result in extract.fetch_html_many(urls, "ua", throttle=HostThrottle(1, 0))
+    }
+
+    assert results["https://a.com/1"].html == "<html>https://a.com/1</html>"
+    assert results["https://b.com/1"].error is None
+    assert results["https://a.com/missing"].html is None
+    assert isinstance(results["https://a.com/missing"].error, ValueError)
+
+
+def test_fetch_html_many_serves_cached_pages_without_a_throttle_slot(monkeypatch, no_slot_throttle):
+    def fail_fetch(url, user_agent):
+        raise AssertionError("cached pages should not be fetched")
+
+    monkeypatch.setattr(extract, "fetch_html", fail_fetch)
+    extract.response_cache.put(
+        extract.CACHE_NAMESPACE,
+        "https://a.com/1",
+        extract.zlib.compress(b"<html>cached</html>"),
+        extract.CACHE_TTL_SECONDS,
+    )
+
+    results = list(extract.fetch_html_many(["https://a.com/1"], "ua", throttle=no_slot_throttle))
+
+    assert [result.html for result in results] == ["<html>cached</html>"]
+
+
+def test_interleave_hosts_round_robins_by_netloc():
+    urls = ["https://a.com/1", "https://a.com/2", "https://b.com/1", "https://c.com/1"]
+
+    assert extract._interleave_hosts(urls) == [
+        "https://a.com/1",
+        "https://b.com/1",
+        "https://c.com/1",
+        "https://a.com/2",
+    ]
+
+
+def test_embedded_json_handles_nested_objects_and_braces_in_strings():
+    html = (
+        '<script>window.product = {"name": "Tote {small}", "price": 120, '
+        '"media": {"image": "a.jpg"}, "compare_at_price": "200.00"};</script>'
+    )
+
+    info = extract._extract_from_embedded_json(html)
+
+    assert info == extract.PriceInfo(120.0, 200.0)
+
+
+def test_embedded_json_ignores_price_outside_objects():
+    assert extract._extract_from_embedded_json('"price": 10 }') == extract.PriceInfo(
+        None, None
+    )
+
+
+def test_embedded_json_survives_stray_quotes_before_the_object():
+    html = (
+        '<p>15" laptop</p><script>s.replace(/"/g, "");'
+        'var x = {"price": "99.00", "was_price": "120.00"};</script>'
+    )
+
+    info = extract._extract_from_embedded_json(html)
+
+    assert info == extract.PriceInfo(99.0, 120.0)
+
+
+def test_embedded_json_finds_price_on_large_page():
+    filler = (
+        '<div data-x=\'{"a": [1, {"b": "c"}]}\'>15" laptop {braces}</div>'
+        '<script>a.replace(/"/g, ""); var o = {"k": "v"};</script>\n'
+    )
+    html = filler * 3000 + '<script>var p = {"sku": "1", "price": "49.99", "was_price": "80.00"};</script>'
+
+    info = extract._extract_from_embedded_json(html)
+
+    assert info == extract.PriceInfo(49.99, 80.0)
+
+
+def test_embedded_json_bounds_work_for_many_keys_without_objects():
+    for html in ('"price": "x", ' * 5000, '"price": "x"} ' * 5000):
+        started = time.perf_counter()
+
+        info = extract._extract_from_embedded_json(html)
+
+        assert info == extract.PriceInfo(None, None)
+        assert time.perf_counter() - started < 1.0
+
+
+def test_jsonld_skips_extruct_without_jsonld_script(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("extruct should not run")
+
+    monkeypatch.setattr(extract.extruct, "extract", fail)
+
+    info = extract._extract_from_jsonld("<html><span>$10</span></html>", "https://a.com")
+
+    assert info == extract.PriceInfo(None, None)
+
+
+def test_jsonld_product_offer_price():
+    html = (
+        '<script type="application/ld+json">{"@type": "Product", "offers": '
+        '{"@type": "Offer", "price": "95.00", "priceSpecification": {"price": 150}}}'
+        "</script>"
+    )
+
+    info = extract._extract_from_jsonld(html, "https://a.com/p")
+
+    assert info == extract.PriceInfo(95.0, 150.0)
+
+
+def test_extract_prices_reuses_result_for_identical_pages(monkeypatch):
+    calls = []
+
+    def fake_extract(html, url):
+        calls.append(url)
+        return extract.PriceInfo(10.0, 20.0)
+
+    monkeypatch.setattr(extract, "_extract_prices", fake_extract)
+    extract.clear_price_cache()
+
+    first = extract.extract_prices("<html>same</html>", "https://a.com/p")
+    second = extract.extract_prices("<html>same</html>", "https://a.com/p?color=red")
+    extract.extract_prices("<html>other</html>", "https://a.com/p")
+
+    assert first == second == extract.PriceInfo(10.0, 20.0)
+    assert len(calls) == 2
+    extract.clear_price_cache()
+
+
+def test_extract_numbers_handles_long_digit_runs():
+    assert extract._extract_numbers(["1" * 10000 + ".99"], 2) == [99.0]
+    assert extract._extract_numbers(["was 12345.678 now 49.99"], 3) == [12345.0, 678.0, 49.99]
+    assert extract._extract_numbers(["$120.00", "/", "$89", "$70"], 2) == [120.0, 89.0]
+
+
+def test_dom_prefers_price_class_then_first_spans():
+    html = '<div><span class="pricey">10</span><span class="x sale-price">$ 49<sup>.99</sup></span></div>'
+    assert extract._extract_from_dom(html) == extract.PriceInfo(49.99, None)
+    html = '<span class="price"><script>var x=12</script><style>b{z-index:34}</style>$40</span>'
+    assert extract._extract_from_dom(html) == extract.PriceInfo(40.0, None)
+    html = "<div><span>10</span><p><span>20.00</span></p></div>"
+    assert extract._extract_from_dom(html) == extract.PriceInfo(10.0, 20.0)
+    assert extract._extract_from_dom("") == extract.PriceInfo(None, None)
+
+
+def test_extract_prices_parses_page_once_for_jsonld_and_dom(monkeypatch):
+    calls = []
+    parse_html = extract._parse_html
+
+    def counting_parse(html):
+        calls.append(html)
+        return parse_html(html)
+
+    monkeypatch.setattr(extract, "_parse_html", counting_parse)
+    html = (
+        '<script type="application/ld+json">{"@type": "Thing"}</script>'
+        '<span class="price">$40 $50</span>'
+    )
+
+    info = extract._extract_prices(html, "https://a.com/p")
+
+    assert info == extract.PriceInfo(40.0, 50.0)
+    assert len(calls) == 1
+
+
+def test_jsonld_dispatches_on_entry_type():
+    html = (
+        '<script type="application/ld+json">['
+        '{"@type": ["Product"], "offers": {"price": "5.00"}},'
+        '{"@type": "Product", "offers": ["bad", {"price": "0"}]},'
+        '{"@type": "Offer", "price": "60", "priceSpecification": [1]}'
+        "]</script>"
+    )
+
+    info = extract._extract_from_jsonld(html, "https://a.com/p")
+
+    assert info == extract.PriceInfo(60.0, None)
+
+
+def test_extract_prices_stops_before_dom_when_embedded_json_matches(monkeypatch):
+    def fail(html):
+        raise AssertionError("DOM should not be parsed")
+
+    monkeypatch.setattr(extract, "_parse_html", fail)
+    html = '<script>var a = {"price": 0}; var b = {"price": 33.0, "was_price": 44}</script>'
+
+    info = extract._extract_prices(html, "https://a.com/p")
+
+    assert info == extract.PriceInfo(33.0, 44.0)
+
+
+def test_decode_body_keeps_utf8_after_an_ascii_head():
+    body = ("<html><head><title>x</title></head><body>" + "a" * 5000 + "Café €120").encode()
+
+    assert extract._decode_body(body, "text/html").endswith("Café €120")
+    assert extract._decode_body("café".encode("latin-1"), "text/html; charset=ISO-8859-1") == "café"
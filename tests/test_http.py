@@ -0,0 +1,12 @@
+from __future__ import annotations
+
+from research.http import build_session
+
+
+def test_session_retries_ignore_retry_after_header():
+    session = build_session(1, 1)
+
+    retry = session.get_adapter("https://example.com").max_retries
+
+    assert retry.respect_retry_after_header is False
+    assert retry.total == 3
@@ -24,7 +24,97 @@ def test_policy_output_schema_for_inferred():
     assert list(df.columns) == aggregate.POLICY_COLUMNS
 
 
+def test_policy_output_uses_compact_column_dtypes():
+    observations = pd.DataFrame(
+        {
+            "brand": ["BrandA"] * 2,
+            "gender": ["Women"] * 2,
+            "category": ["Dresses"] * 2,
+            "discount_pct": [20.0, 30.0],
+            "url": ["https://a.example/1", "https://a.example/2"],
+        }
+    )
+
+    for obs in (pd.DataFrame(), observations):
+        df = app.build_policy_output(["BrandA", "BrandB"], obs)
+        assert not (df.dtypes == object).any()
+        for column in aggregate.PCT_COLUMNS:
+            assert df[column].dtype == "int16"
+        for column in aggregate.CATEGORICAL_COLUMNS:
+            assert isinstance(df[column].dtype, pd.CategoricalDtype)
+
+
+def test_policy_output_without_brands_is_empty():
+    observations = pd.DataFrame(
+        {
+            "brand": ["BrandA"],
+            "gender": ["Women"],
+            "category": ["Dresses"],
+            "discount_pct": [10.0],
+            "url": ["https://a.example/1"],
+        }
+    )
+
+    df = app.build_policy_output([], observations)
+
+    assert df.empty
+    assert list(df.columns) == aggregate.POLICY_COLUMNS
+
+
+def test_policy_output_with_missing_group_columns_is_inferred():
+    observations = pd.DataFrame({"brand": ["BrandA"], "discount_pct": [10.0]})
+
+    df = app.build_policy_output(["BrandA"], observations)
+
+    assert df.shape[0] == len(aggregate.CATEGORIES)
+    assert set(df["evidence_level"]) == {"INFERRED"}
+
+
 def test_progress_value_is_clamped():
     assert app._calculate_progress(["a", "b"], 4) == 0.5
     assert app._calculate_progress(["a", "b", "c"], 2) == 1.0
     assert app._calculate_progress([], 0) == 0.0
+
+
+def test_observed_discounts_use_median_and_p75():
+    discounts = [10, 20, 30, 40, 50, None, 0]
+    observations = pd.DataFrame(
+        {
+            "brand": ["BrandX"] * len(discounts),
+            "gender": ["Women"] * len(discounts),
+            "category": ["Shoes"] * len(discounts),
+            "discount_pct": discounts,
+        }
+    )
+
+    df = app.build_policy_output(["BrandX"], observations)
+
+    row = df[(df["gender"] == "Women") & (df["category"] == "Shoes")].iloc[0]
+    assert row["evidence_level"] == "OBSERVED"
+    assert row["public_sale_discount_pct"] == 30
+    assert row["public_discount_cap_pct"] == 40
+    assert (df["evidence_level"] == "INFERRED").sum() == len(aggregate.CATEGORIES) - 1
+
+
+def test_find_latest_run_skips_runs_without_progress(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert app._find_latest_run() is None
+    for run_id in ["20240101_000000", "20240301_000000", "20240201_000000"]:
+        (tmp_path / "runs" / run_id).mkdir(parents=True)
+    (tmp_path / "runs" / "20240101_000000" / "progress.json").write_text("{}")
+    (tmp_path / "runs" / "20240201_000000" / "progress.json").write_text("{}")
+
+    assert app._find_latest_run() == "20240201_000000"
+
+
+def test_save_excel_round_trips_policy_output(tmp_path):
+    df = app.build_policy_output(["BrandA"], pd.DataFrame())
+    path = tmp_path / "out.xlsx"
+
+    app.save_excel(df, path)
+
+    loaded = pd.read_excel(path, sheet_name="us_discount_policy")
+    assert list(loaded.columns) == aggregate.POLICY_COLUMNS
+    assert loaded["brand"].tolist() == df["brand"].tolist()
+    assert loaded["public_sale_discount_pct"].tolist() == df["public_sale_discount_pct"].tolist()
+    assert loaded["why"].tolist() == df["why"].tolist()
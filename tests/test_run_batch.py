@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import queue
+import threading
+
+import pandas as pd
+
+import app
+from research import aggregate, cache, discovery, extract, response_cache
+
+
+def test_run_batch_records_observations_and_discovered_urls(tmp_path, monkeypatch):
+    def fake_discover(query, user_agent, max_results):
+        return [f"https://example.com/{abs(hash(query))}"]
+
+    def fake_fetch(url, user_agent):
+        return '<span class="price">$80.00 $100.00</span>'
+
+    monkeypatch.setattr(discovery, "discover_urls", fake_discover)
+    monkeypatch.setattr(extract, "fetch_html", fake_fetch)
+    paths = cache.ensure_run_dir("batch", root=str(tmp_path))
+    discovered = {}
+    config = {"request_delay_seconds": 0, "max_urls_per_combo": 2}
+
+    errors = app.run_batch(["BrandA"], config, paths, discovered)
+
+    combos = len(aggregate.CATEGORIES) * len(app.COMPETITORS)
+    assert errors == []
+    assert len(discovered) == combos
+    observations = pd.read_csv(paths.observations)
+    assert len(observations) == combos
+    assert set(observations["discount_pct"]) == {20}
+
+
+def test_run_batches_saves_progress_per_batch(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "run_batch", lambda batch, *args: [f"err {batch[0]}"])
+    paths = cache.ensure_run_dir("batches", root=str(tmp_path))
+    progress_queue = queue.Queue()
+    payload = {"run_id": "batches", "completed_brands": []}
+
+    app.run_batches(
+        ["A", "B", "C"], {"batch_size": 2}, paths, payload, threading.Event(), progress_queue
+    )
+
+    assert cache.load_progress(paths)["completed_brands"] == ["A", "B", "C"]
+    assert app._drain_progress_queue(progress_queue) == ["err A", "err C"]
+
+
+def test_run_batches_stops_when_requested(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "run_batch", lambda *args: [])
+    paths = cache.ensure_run_dir("stopped", root=str(tmp_path))
+    stop_event = threading.Event()
+    stop_event.set()
+
+    app.run_batches(["A"], {}, paths, {"completed_brands": []}, stop_event, queue.Queue())
+
+    assert cache.load_progress(paths) is None
+
+
+def test_discover_combo_uses_cached_search_results_without_a_throttle_slot(
+    monkeypatch, no_slot_throttle
+):
+    def fail_discover(query, user_agent, max_results):
+        raise AssertionError("cached searches should not hit the search API")
+
+    monkeypatch.setattr(discovery, "discover_urls", fail_discover)
+    for query in app.build_query("BrandA", "Women", "Clothing", "example.com"):
+        response_cache.put(
+            discovery.CACHE_NAMESPACE,
+            discovery._cache_key(query, 2),
+            b'["https://example.com/p"]',
+            discovery.CACHE_TTL_SECONDS,
+        )
+
+    result = app._discover_combo(
+        "BrandA", "Women", "Clothing", "Example", "example.com", [], 2, "ua", no_slot_throttle
+    )
+
+    assert result.urls == ["https://example.com/p"]
+    assert result.discovered